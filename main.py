@@ -1,49 +1,19 @@
 import argparse
 import asyncio
 import logging
-import sqlite3
+from datetime import timedelta
 
 import aioconsole
-import pandas as pd
-from requests.exceptions import ReadTimeout
-from sqlalchemy.orm import Session
-from urllib3.exceptions import MaxRetryError
+from sqlalchemy.exc import OperationalError
 
-from dbo import engine, sql_string
+from dbo import Base, engine, sql_string
 from net_logging import LogDBHandler
-from radio_operator import Base, RadioOperator
+from operator_refresh import RefreshScheduler
+from work_queue import QueueWorker, WorkQueue
 
 
-def log_call_sign_orm(repeater: str, call_sign: str) -> None:
-    with Session(engine) as session:
-        try:
-            operator = RadioOperator(call_sign, repeater)
-            session.add(operator)
-            session.commit()
-        except ValueError as e:
-            print(str(e))
-
-
-def log_call_sign_pd(repeater: str, call_sign: str) -> None:
-    with sqlite3.connect("checkins.db") as db:
-        try:
-            operator = RadioOperator(call_sign, repeater)
-            user_info = operator.operator_info()
-            user_df = pd.DataFrame(user_info, index=[0])
-            user_df.to_sql("checkins", db, if_exists="append", index=False)
-        except ValueError as e:
-            print(str(e))
-        except MaxRetryError as e:
-            print(f"Max Retries Error: {str(e)}")
-        except ConnectionError as e:
-            print(f"ConnectionError: {str(e)}")
-        except TimeoutError as e:
-            print(f"TimeoutError: {str(e)}")
-        except ReadTimeout as e:
-            print(f"ReadTimeout: {str(e)}")
-
-
-async def main(default_repeater: str = "VE7RVF", accept_default: bool = False):
+async def main(work_queue: WorkQueue, worker: QueueWorker,
+               default_repeater: str = "VE7RVF", accept_default: bool = False):
     loop = asyncio.get_running_loop()
     if accept_default is True:
         repeater = default_repeater
@@ -57,7 +27,13 @@ async def main(default_repeater: str = "VE7RVF", accept_default: bool = False):
         call_sign = call_sign.strip().upper()
         if not call_sign:
             continue
-        loop.run_in_executor(None, log_call_sign_orm, repeater, call_sign)
+        # Journal first so the check-in survives restarts and outages
+        try:
+            await loop.run_in_executor(None, work_queue.enqueue_checkin, call_sign, repeater)
+        except OperationalError as e:
+            print(f"Could not save check-in for {call_sign}, please enter it again: {e!s}")
+            continue
+        worker.notify()
 
 
 if __name__ == "__main__":
@@ -76,7 +52,28 @@ if __name__ == "__main__":
     parser.add_argument(
         "--debug", help="Enable debug mode", action=argparse.BooleanOptionalAction
     )
+    parser.add_argument(
+        "--re-enrich",
+        help="Queue existing check-ins without operator details to be looked up again",
+        action=argparse.BooleanOptionalAction,
+    )
+    parser.add_argument(
+        "--refresh-after",
+        help="Refresh operator details older than this many days in the background, "
+        "starting one interval after launch (prefer running operator_refresh.py from cron)",
+        type=int,
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        help="Hours between background refreshes (default: 24)",
+        type=float,
+        default=24,
+    )
     args = parser.parse_args()
+    if args.refresh_after is not None and args.refresh_after <= 0:
+        parser.error("--refresh-after must be a positive number of days")
+    if args.refresh_interval <= 0:
+        parser.error("--refresh-interval must be a positive number of hours")
 
     # ORM
     Base.metadata.create_all(engine)
@@ -94,10 +91,25 @@ if __name__ == "__main__":
         root_logger.setLevel(logging.DEBUG)
         root_logger.debug("Debug mode enabled")
 
+    # Durable work queue; picks up anything left over from a previous run
+    work_queue = WorkQueue()
+    if args.re_enrich:
+        work_queue.enqueue_bare_checkins()
+    worker = QueueWorker(work_queue)
+    worker.start()
+    refresher = None
+    if args.refresh_after:
+        refresher = RefreshScheduler(timedelta(days=args.refresh_after),
+                                     timedelta(hours=args.refresh_interval),
+                                     work_queue=work_queue)
+        refresher.start()
+
     # Asyncio loop
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    main_task = loop.create_task(main(accept_default=args.accept_defaults))
+    main_task = loop.create_task(
+        main(work_queue, worker, accept_default=args.accept_defaults)
+    )
     exception_log_message = None
     try:
         loop.run_until_complete(main_task)
@@ -112,3 +124,10 @@ if __name__ == "__main__":
         for task in pending_tasks:
             task.cancel()
         loop.close()
+        # Anything not processed yet stays journaled for the next run
+        worker.stop(timeout=10)
+        if refresher:
+            refresher.stop(timeout=10)
+        pending_count = work_queue.pending_count()
+        if pending_count:
+            root_logger.info(f"{pending_count} queued item(s) will resume on next start")
@@ -0,0 +1,440 @@
+"""Call sign lookups against the ISED (Canada) and FCC (USA) databases.
+
+Lookups produce a compact ``OperatorInfo`` rather than an ORM-mapped
+``RadioOperator`` so bulk and high-rate ingestion can insert results directly
+with Core statements.
+"""
+
+from __future__ import annotations
+import copy
+import logging
+import re
+from datetime import datetime
+from io import StringIO
+from socket import gaierror
+
+import requests
+from lxml import etree
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from urllib3.exceptions import MaxRetryError, NameResolutionError
+
+# Shares the radio_operator logger so its configured level still applies.
+logger = logging.getLogger("radio_operator")
+
+# Errors that mean the lookup services could not be reached, as opposed to
+# the call sign simply not being found.
+CONNECTIVITY_ERRORS = (ConnectTimeout, ReadTimeout, ConnectionError,
+                       TimeoutError, RequestsConnectionError, MaxRetryError,
+                       NameResolutionError, gaierror)
+
+# Operator details filled in by a lookup, named after the ``checkins`` columns.
+DETAIL_FIELDS = ("full_name", "address", "city", "province", "postal_code",
+                 "qualifications", "status", "expiration_date", "frn")
+
+
+def _clean(value):
+    """Strip strings and turn empty values into None."""
+    if isinstance(value, str):
+        value = value.strip()
+    return value or None
+
+
+class OperatorInfo:
+    """Result of a call sign lookup."""
+
+    __slots__ = ("call_sign", "lookup_failed") + DETAIL_FIELDS
+
+    def __init__(self, call_sign: str, lookup_failed: bool = False, **details) -> None:
+        self.call_sign = call_sign.strip()
+        self.lookup_failed = lookup_failed
+        for field in DETAIL_FIELDS:
+            setattr(self, field, _clean(details.get(field)))
+
+    def __str__(self):
+        location = f"{self.city}, {self.province}" if self.city else f"{self.province}"
+        return f"{self.full_name} ({self.call_sign}) from {location}."
+
+    @classmethod
+    def from_user_info(cls, call_sign: str, user_info: dict | None,
+                       lookup_failed: bool = False) -> OperatorInfo:
+        """Build from the dictionaries returned by the scraping functions."""
+        if not user_info:
+            return cls(call_sign, lookup_failed=lookup_failed)
+        details = {field: user_info.get(field) for field in DETAIL_FIELDS}
+        details["frn"] = user_info.get("FRN")
+        return cls(user_info.get("call_sign") or call_sign,
+                   lookup_failed=lookup_failed, **details)
+
+    def is_bare(self) -> bool:
+        """Whether the lookup produced no operator details."""
+        return not self.full_name
+
+    def details(self) -> dict:
+        """Operator details keyed by ``checkins`` column name."""
+        return {field: getattr(self, field) for field in DETAIL_FIELDS}
+
+    def checkin_row(self, repeater: str | None, checkin_date: datetime) -> dict:
+        """Column values for a ``checkins`` row."""
+        row = self.details()
+        row["full_name"] = self.full_name or ""
+        row["call_sign"] = self.call_sign
+        row["repeater"] = repeater
+        row["checkin_date"] = checkin_date
+        return row
+
+
+def lookup_operator(call_sign: str, lookup: bool = True) -> OperatorInfo:
+    """Look up a call sign, returning a bare result if it cannot be found.
+
+    ``lookup_failed`` is set when the lookup was skipped or the upstream
+    services could not be reached, meaning the result should be retried later.
+    """
+    user_info = None
+    try:
+        if not lookup:
+            logger.info(f"Lookup deferred for call sign: {call_sign}")
+            return OperatorInfo(call_sign, lookup_failed=True)
+        elif validate_american_call_sign(call_sign):
+            logger.info(f"American call sign detected: {call_sign}")
+            user_info = get_american_call_sign_info(call_sign)
+        elif validate_canadian_call_sign(call_sign):
+            logger.info(f"Canadian call sign detected: {call_sign}")
+            user_info = get_canadian_call_sign_info(call_sign)
+        elif not call_sign.isalnum():
+            log_message = f"Call sign is porbably invalid due to not being alphanumeric: {call_sign}"
+            logger.warning(log_message)
+        else:
+            log_message = f"Call sign is not Canadian nor American, or is invalid: {call_sign}"
+            logger.warning(log_message)
+    except CONNECTIVITY_ERRORS as e:
+        logger.exception(f"Except: {e!s}")
+        return OperatorInfo(call_sign, lookup_failed=True)
+    return OperatorInfo.from_user_info(call_sign, user_info)
+
+
+def validate_american_call_sign(call_sign: str) -> bool | None:
+    """Validate an American call sign."""
+    call_sign = call_sign.upper().strip().replace(" ", "").replace("-", "")
+    if not call_sign:
+        return False
+
+    validation_rules = {
+        "group_d_regex": r"(K|W)[A-Z]\d[A-Z]{3}",
+        "group_c_1_regex": r"(K|N|W)\d[A-Z]{3}",
+        "group_c_2_regex": r"(KL|NL|WL|NP|WP|KH|NH|WH)\d[A-Z]{3}",
+        "group_b_regex": r"(K|N|W)[A-Z]\d[A-Z]{2}",
+        "group_a_1_regex": r"A[A-K]\d[A-Z]{2}",
+        "group_a_2_regex": r"(A[A-K]|K[A–Z]|N[A–Z]|W[A–Z])\d[A-Z]",
+        "group_a_3_regex": r"(K|N|W)\d[A-Z]{2}"
+    }
+
+    return any(re.match(rule, call_sign) for _, rule in validation_rules.items())
+
+
+def validate_canadian_call_sign(call_sign: str) -> bool:
+    call_sign = call_sign.upper().strip().replace(" ", "").replace("-", "")
+    if not call_sign:
+        return False
+
+    valid_canadian_prefixes = [
+        "VE1", "VA1",  # Nova Scotia
+        "VE2", "VA2",  # Quebec
+        "VE3", "VA3",  # Ontario
+        "VE4", "VA4",  # Manitoba
+        "VE5", "VA5",  # Saskatchewan
+        "VE6", "VA6",  # Alberta
+        "VE7", "VA7",  # British Columbia
+        "VE8",         # Northwest Territories
+        "VE9",         # New Brunswick
+        "VE0",         # International Waters
+        "VO1",         # Newfoundland
+        "VO2",         # Labrador
+        "VY1",         # Yukon
+        "VY2",         # Prince Edward Island
+        "VY9",         # Government of Canada
+        "VY0",         # Nunavut
+        "CY0",         # Sable Is.
+        "CY9",         # St-Paul Is.
+    ]
+
+    has_proper_prefix = call_sign.startswith(tuple(valid_canadian_prefixes))
+    has_proper_format = re.match(r"^[A-Z]{2}\d[A-Z]{2,3}$", call_sign)
+
+    return has_proper_format and has_proper_prefix
+
+
+def _state_abbreviation_to_full_name(state_abbreviation: str) -> str:
+    if not state_abbreviation:
+        return ""
+    state_abbreviation = state_abbreviation.strip().upper()
+    if len(state_abbreviation) != 2:
+        return state_abbreviation
+    abbrevations = {
+        "AL": "Alabama",
+        "AK": "Alaska",
+        "AZ": "Arizona",
+        "AR": "Arkansas",
+        "AS": "American Samoa",
+        "CA": "California",
+        "CO": "Colorado",
+        "CT": "Connecticut",
+        "DE": "Delaware",
+        "DC": "District of Columbia",
+        "FL": "Florida",
+        "GA": "Georgia",
+        "GU": "Guam",
+        "HI": "Hawaii",
+        "ID": "Idaho",
+        "IL": "Illinois",
+        "IN": "Indiana",
+        "IA": "Iowa",
+        "KS": "Kansas",
+        "KY": "Kentucky",
+        "LA": "Louisiana",
+        "ME": "Maine",
+        "MD": "Maryland",
+        "MA": "Massachusetts",
+        "MI": "Michigan",
+        "MN": "Minnesota",
+        "MS": "Mississippi",
+        "MO": "Missouri",
+        "MT": "Montana",
+        "NE": "Nebraska",
+        "NV": "Nevada",
+        "NH": "New Hampshire",
+        "NJ": "New Jersey",
+        "NM": "New Mexico",
+        "NY": "New York",
+        "NC": "North Carolina",
+        "ND": "North Dakota",
+        "MP": "Northern Mariana Islands",
+        "OH": "Ohio",
+        "OK": "Oklahoma",
+        "OR": "Oregon",
+        "PA": "Pennsylvania",
+        "PR": "Puerto Rico",
+        "RI": "Rhode Island",
+        "SC": "South Carolina",
+        "SD": "South Dakota",
+        "TN": "Tennessee",
+        "TX": "Texas",
+        "TT": "Trust Territories",
+        "UT": "Utah",
+        "VT": "Vermont",
+        "VA": "Virginia",
+        "VI": "Virgin Islands",
+        "WA": "Washington",
+        "WV": "West Virginia",
+        "WI": "Wisconsin",
+        "WY": "Wyoming"
+    }
+    full_name = abbrevations.get(state_abbreviation)
+    if not full_name:
+        full_name = ""
+    return full_name
+
+
+def get_american_call_sign_info(call_sign: str) -> dict:
+    """Get operator info with American call sign.
+
+    Connection errors and timeouts are raised rather than returning partial
+    details, so callers can tell an unreachable service from a missing record.
+    """
+    base_endpoint = "https://wireless2.fcc.gov/UlsApp/UlsSearch/"
+    with requests.Session() as sess:
+        call_sign = call_sign.strip().upper()
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+            "Accept": "*/*",
+            "Connection": "keep-alive",
+            "Accept-Encoding": "gzip, deflate, br"
+        }
+        fcc_amateur_search_endpoint = base_endpoint + "searchAmateur.jsp"
+        r = sess.get(fcc_amateur_search_endpoint, headers=headers, timeout=(5, 30))
+        sess.cookies = r.cookies
+        html = r.content.decode("utf-8")
+        parser = etree.HTMLParser()
+        tree = etree.parse(StringIO(html), parser)
+        form_action = tree.xpath("//form[@name='amateurSearch']/@action")[0]
+        logger.info(f"Might need to send request to {form_action}")
+        amateur_results_endpoint = base_endpoint + "results.jsp"
+
+        amateur_search_form_data = {
+            "fiUlsExactMatchInd": "Y",
+            "fiulsTrusteeName": "",
+            "fiOwnerName": "",
+            "fiUlsFRN": "",
+            "fiCity": "",
+            "ulsState": "",
+            "fiUlsZipcode": "",
+            "ulsCallSign": f"{call_sign}",
+            "statusAll": "Y",
+            "ulsDateType": "",
+            "dateSearchType": "",
+            "ulsFromDate": "",
+            "ulsToDate": "",
+            "fiRowsPerPage": "100",
+            "ulsSortBy": "uls_l_callsign",
+            "ulsOrderBy": "ASC",
+            "Submit": "Submit",
+            "hiddenForm": "hiddenForm",
+            "jsValidated": "true",
+        }
+        post_headers = copy.deepcopy(headers)
+        post_headers["Content-Type"] = "application/x-www-form-urlencoded"
+        post_headers["Referer"] = fcc_amateur_search_endpoint
+        post_headers["Accept-Encoding"] = "gzip, deflate, br, zstd"
+        post_headers["Cache-Control"] = "max-age=0"
+        post_headers["Origin"] = "https://wireless2.fcc.gov"
+        operator_details = {}
+        r = sess.post(amateur_results_endpoint,
+                      data=amateur_search_form_data,
+                      headers=post_headers,
+                      timeout=(5, 30)
+                      )
+        html = r.content.decode("utf-8)").strip()
+        tree = etree.parse(StringIO(html), parser)
+        results_xpath = "//table[@summary='License search results']//tr[not(th)]"
+        matches = tree.xpath(results_xpath)
+        if not matches:
+            log_message = f"No matches found for {call_sign}"
+            logger.info(log_message)
+            return
+        ham = matches[0]
+        details_url = None
+        # 0. Result number
+        # 1. Call Sign/Lease ID
+        # 2. Name
+        # 3. FRN
+        # 4. Radio Service
+        # 5. Status
+        # 6. Expiration Date
+        for i, e in enumerate(ham.xpath("./td")):
+            if i == 0:
+                continue
+            if i == 1:
+                path = e.xpath("./a/@href")
+                details_url = base_endpoint + path[0].strip()
+                operator_details["call_sign"] = e.xpath("./a/text()")[0].strip()
+            if i == 2:
+                full_name = e.xpath("./text()")[0]
+                operator_details["full_name"] = full_name.strip()
+            if i == 3:
+                frn = e.xpath("./text()")[0]
+                operator_details["FRN"] = frn.strip()
+            if i == 5:
+                status = e.xpath("./text()")[0]
+                operator_details["status"] = status.strip()
+            if i == 6:
+                expiration_date = e.xpath("./text()")[0]
+                expiration_date = expiration_date.strip()
+                expiration_date = datetime.strptime(expiration_date, "%m/%d/%Y")
+                operator_details["expiration_date"] = expiration_date
+
+        r = sess.get(details_url,
+                     headers=headers,
+                     timeout=(5, 30)
+                     )
+        html = r.content.decode("utf-8)").strip()
+        tree = etree.parse(StringIO(html), parser)
+
+        # Extract Address
+        address_xpath = "//tr[td/table//td/b[contains(text(), 'Licensee') and contains(text(), 'Information')]]/following-sibling::tr[1]//table//tr[3]/td[1]/text()"
+        matches = tree.xpath(address_xpath)
+        address_arr = []
+        for match in matches:
+            component = match.strip()
+            if component and component != operator_details["full_name"]:
+                component = component.replace(",", "\n")
+                component = component.split("\n")
+                if isinstance(component, list):
+                    address_arr += component
+                else:
+                    address_arr.append(component)
+
+        operator_details["address"], operator_details["city"], operator_details["province"], operator_details["postal_code"] = address_arr
+        operator_details["province"] = _state_abbreviation_to_full_name(operator_details["province"])
+
+        # Get operator class
+        class_xpath = "//tr[td/table//td/b[contains(text(), 'Amateur') and contains(text(), 'Data')]]/following-sibling::tr[1]//table//tr/td[contains(text(), 'Operator Class')]/following-sibling::td[1]/text()"
+        class_matches = tree.xpath(class_xpath)
+        technician_class = [x.strip() for x in class_matches if x.strip()]
+
+        # Get operator group
+        group_xpath = "//tr[td/table//td/b[contains(text(), 'Amateur') and contains(text(), 'Data')]]/following-sibling::tr[1]//table//tr/td[contains(text(), 'Group')]/following-sibling::td[1]/text()"
+        group_match = tree.xpath(group_xpath)
+        group = [x.strip() for x in group_match if x.strip()]
+        qualifications = "".join(technician_class) + " - " + "Group " + "".join(group)
+        operator_details["qualifications"] = qualifications
+
+    return operator_details
+
+
+def get_canadian_call_sign_info(call_sign: str) -> dict | None:
+    """Get operator information for a Canadian call sign."""
+    call_sign = call_sign.strip().upper()
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
+        "Accept": "*/*",
+        "Connection": "keep-alive",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Cache-Control": "max-age=0"
+    }
+    amateur_results_endpoint = "https://apc-cap.ic.gc.ca/pls/apc_anon/query_amat_cs$callsign.actionquery"
+    amateur_search_form_data = {
+        "P_CALLSIGN": call_sign,
+        "P_SURNAME": None,
+        "P_CITY": None,
+        "P_PROV_STATE_CD": None,
+        "P_POSTAL_ZIP_CODE": None,
+        "Z_ACTION": "QUERY",
+        "Z_CHK": 0,
+    }
+    response = requests.post(amateur_results_endpoint, headers=headers, data=amateur_search_form_data,
+                             timeout=(5, 30))
+    html = response.content.decode("utf-8")
+    details_url_pattern = r'<a href="(?P<details_url>.*)">' + call_sign.upper() + "</a>"
+    details_url = re.search(details_url_pattern, html)
+    if not details_url:
+        log_message = f"No URL found for {call_sign}"
+        logger.info(log_message)
+        return
+    details_url = "https://apc-cap.ic.gc.ca/pls/apc_anon/" + details_url.group("details_url")
+    details_url = details_url.replace("&amp;", "&")
+    response = requests.get(details_url, headers=headers, timeout=(5, 30))
+    html = response.content.decode("utf-8")
+    parser = etree.HTMLParser()
+    tree = etree.parse(StringIO(html), parser)
+
+    call_sign = tree.xpath("//table//th[contains(text(),'Call Sign')]//following-sibling::td/text()")[0]
+    name = tree.xpath("//table//th[contains(text(),'Name')]//following-sibling::td/text()")[0]
+    address = tree.xpath("//table//th[contains(text(),'Address')]//following-sibling::td/text()")[0]
+    city = tree.xpath("//table//th[contains(text(),'City')]//following-sibling::td/text()")[0]
+    province = tree.xpath("//table//th[contains(text(),'Province')]//following-sibling::td/text()")[0]
+    postal_code = tree.xpath("//table//th[contains(text(),'Postal Code')]//following-sibling::td/text()")[0]
+    qualifications = tree.xpath("//table//th[contains(text(),'Qualifications')]//following-sibling::td/text()")[0]
+    qualifications_arr = [q.strip() for q in qualifications.split(",")]
+    basic_index = -1
+    for i, q in enumerate(qualifications_arr):
+        if q == "Basic with Honours":
+            qualifications_arr[i] = "Basic+"
+        if q == "Basic":
+            basic_index = i
+    if "Basic+" in qualifications_arr and basic_index >= 0:
+        qualifications_arr.pop(basic_index)
+    qualifications = ", ".join(qualifications_arr)
+
+    return {
+        "full_name": name.strip(),
+        "call_sign": call_sign.strip(),
+        "address": address.strip(),
+        "city": city.strip(),
+        "province": province.strip(),
+        "postal_code": postal_code.strip(),
+        "qualifications": qualifications.strip(),
+        "status": "Active",
+        "expiration_date": None,
+        "FRN": None,
+    }
+
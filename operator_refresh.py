@@ -0,0 +1,259 @@
+"""Background re-enrichment of stale operator records.
+
+Operator details in ``checkins`` are captured at check-in time. This job finds
+call signs whose details are older than a threshold, looks them up again in
+parallel under a rate limit, and writes back only the fields that changed.
+Progress is checkpointed per call sign in ``operator_refresh``, so an
+interrupted run resumes where it left off.
+"""
+
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import DateTime, String, func, or_, select, update
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from dbo import Base, engine
+from operator_lookup import (DETAIL_FIELDS, OperatorInfo, lookup_operator,
+                             validate_american_call_sign,
+                             validate_canadian_call_sign)
+from radio_operator import RadioOperator
+from work_queue import WorkQueue, is_online
+
+logger = logging.getLogger("operator_refresh")
+
+
+class OperatorRefresh(Base):
+    __tablename__ = "operator_refresh"
+
+    call_sign: Mapped[str] = mapped_column(String(32), primary_key=True)
+    refreshed_at: Mapped[datetime] = mapped_column(DateTime)
+    changed_fields: Mapped[Optional[str]] = mapped_column(String(1024))
+
+
+class RateLimiter:
+    """Spaces out calls across threads to at most ``rate`` per second."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def find_stale_call_signs(session: Session, cutoff: datetime,
+                          limit: int) -> list[str]:
+    """Call signs whose details were last fetched before ``cutoff``.
+
+    A call sign's details date from its last refresh or its latest check-in,
+    whichever is more recent.
+    """
+    checkins = RadioOperator.__table__
+    latest_checkin = func.max(checkins.c.checkin_date)
+    # SQLite's two-argument max() returns NULL if either side is NULL
+    fetched_at = func.max(func.coalesce(OperatorRefresh.refreshed_at, latest_checkin),
+                          func.coalesce(latest_checkin, OperatorRefresh.refreshed_at))
+    return list(session.scalars(
+        select(checkins.c.call_sign)
+        .outerjoin(OperatorRefresh, OperatorRefresh.call_sign == checkins.c.call_sign)
+        .group_by(checkins.c.call_sign, OperatorRefresh.refreshed_at)
+        .having(fetched_at < cutoff)
+        .order_by(fetched_at)
+        .limit(limit)
+    ))
+
+
+def changed_details(session: Session, call_sign: str, info: OperatorInfo) -> dict:
+    """Fields of ``info`` that differ from the latest check-in of a call sign.
+
+    Missing values in ``info`` are never treated as changes, so a refresh
+    cannot overwrite known details with NULL.
+    """
+    checkins = RadioOperator.__table__
+    latest = session.execute(
+        select(*[checkins.c[field] for field in DETAIL_FIELDS])
+        .where(checkins.c.call_sign == call_sign)
+        .order_by(checkins.c.checkin_date.desc())
+        .limit(1)
+    ).mappings().first()
+    details = {field: value for field, value in info.details().items() if value is not None}
+    if latest is None:
+        return details
+    return {field: value for field, value in details.items() if latest[field] != value}
+
+
+def write_changed_details(session: Session, call_sign: str, changes: dict) -> int:
+    """Update only the changed fields, and only on rows where they differ."""
+    if not changes:
+        return 0
+    checkins = RadioOperator.__table__
+    result = session.execute(
+        update(checkins)
+        .where(checkins.c.call_sign == call_sign,
+               or_(*[checkins.c[field].is_distinct_from(value)
+                     for field, value in changes.items()]))
+        .values(**changes)
+    )
+    return result.rowcount
+
+
+def _checkpoint(session: Session, call_sign: str, changes: dict | None = None) -> None:
+    session.merge(OperatorRefresh(
+        call_sign=call_sign,
+        refreshed_at=datetime.now(),
+        changed_fields=", ".join(changes) if changes else None,
+    ))
+
+
+def refresh_stale_operators(older_than: timedelta, max_workers: int = 4,
+                            rate: float = 1.0, batch_size: int = 50,
+                            stop_event: threading.Event | None = None,
+                            busy: Callable[[], bool] | None = None) -> int:
+    """Re-fetch stale call signs in batches; returns how many were refreshed.
+
+    Stops early when ``stop_event`` is set, when ``busy()`` is true between
+    batches, or when the lookup services become unreachable; call signs that
+    were not checkpointed are picked up next run.
+    """
+    if older_than <= timedelta(0):
+        raise ValueError("older_than must be positive")
+    # Fixed for the whole run, so call signs checkpointed during this run are
+    # never stale again and the run always ends.
+    cutoff = datetime.now() - older_than
+    limiter = RateLimiter(rate)
+
+    def stopping() -> bool:
+        return stop_event is not None and stop_event.is_set()
+
+    def fetch(call_sign: str) -> OperatorInfo:
+        if stopping():
+            return OperatorInfo(call_sign, lookup_failed=True)
+        limiter.acquire()
+        try:
+            return lookup_operator(call_sign)
+        except Exception as e:
+            logger.exception(f"Refresh lookup failed for {call_sign}: {e!s}")
+            return OperatorInfo(call_sign)
+
+    refreshed = 0
+    with ThreadPoolExecutor(max_workers=max_workers,
+                            thread_name_prefix="Refresh") as executor:
+        while not stopping():
+            if busy is not None and busy():
+                logger.info("Refresh paused; check-ins are waiting")
+                break
+            with Session(engine) as session:
+                call_signs = find_stale_call_signs(session, cutoff, batch_size)
+            if not call_signs:
+                break
+            lookups = [cs for cs in call_signs
+                       if validate_american_call_sign(cs) or validate_canadian_call_sign(cs)]
+            # Fetch before writing so no write transaction is held open
+            # while waiting on the network.
+            results = dict(zip(lookups, executor.map(fetch, lookups)))
+            went_offline = False
+            changed = {}
+            with Session(engine) as session:
+                for call_sign in call_signs:
+                    info = results.get(call_sign)
+                    if info is not None and info.lookup_failed:
+                        # Not checkpointed, so it is picked up next run
+                        went_offline = True
+                        continue
+                    if info is None or info.is_bare():
+                        # Nothing to look up or not found upstream; keep what
+                        # we have until it is stale again
+                        _checkpoint(session, call_sign)
+                        continue
+                    changes = changed_details(session, call_sign, info)
+                    write_changed_details(session, call_sign, changes)
+                    _checkpoint(session, call_sign, changes)
+                    refreshed += 1
+                    if changes:
+                        changed[call_sign] = changes
+                session.commit()
+            # Log only after the commit; LogDBHandler writes to the same database.
+            for call_sign, changes in changed.items():
+                logger.info(f"Refreshed {call_sign}: {', '.join(changes)}")
+            if went_offline:
+                logger.warning("Refresh paused; lookups unreachable or stopping")
+                break
+    logger.info(f"Refreshed {refreshed} call sign(s)")
+    return refreshed
+
+
+class RefreshScheduler(threading.Thread):
+    """Background thread that periodically refreshes stale operator records.
+
+    The first refresh runs one ``interval`` after start-up, and refreshes only
+    run while ``work_queue`` has nothing pending, so they stay out of the way
+    of a net in progress. Running ``operator_refresh.py`` on its own (e.g. from
+    cron) outside net times is the preferred way to refresh.
+    """
+
+    def __init__(self, older_than: timedelta, interval: timedelta,
+                 work_queue: WorkQueue | None = None,
+                 max_workers: int = 2, rate: float = 0.5) -> None:
+        super().__init__(name="RefreshScheduler", daemon=True)
+        self.older_than = older_than
+        self.interval = interval
+        self.work_queue = work_queue
+        self.max_workers = max_workers
+        self.rate = rate
+        self._stopping = threading.Event()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Ask the scheduler to finish its current batch and exit."""
+        self._stopping.set()
+        self.join(timeout)
+
+    def _busy(self) -> bool:
+        return self.work_queue is not None and self.work_queue.pending_count() > 0
+
+    def run(self) -> None:
+        while not self._stopping.wait(self.interval.total_seconds()):
+            try:
+                if not self._busy() and is_online():
+                    refresh_stale_operators(self.older_than,
+                                            max_workers=self.max_workers,
+                                            rate=self.rate,
+                                            stop_event=self._stopping,
+                                            busy=self._busy)
+            except Exception as e:
+                logger.exception(f"Refresh error: {e!s}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Net Control - Refresh operators",
+        description="Re-fetch operator details that are older than a threshold.",
+    )
+    parser.add_argument("--days", type=int, default=30,
+                        help="Refresh call signs not looked up for this many days (default: 30)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of parallel lookups (default: 4)")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="Maximum lookups per second (default: 1)")
+    args = parser.parse_args()
+    if args.days <= 0:
+        parser.error("--days must be positive")
+    if args.workers <= 0 or args.rate <= 0:
+        parser.error("--workers and --rate must be positive")
+
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(engine)
+    count = refresh_stale_operators(timedelta(days=args.days),
+                                    max_workers=args.workers, rate=args.rate)
+    print(f"Refreshed {count} call sign(s)")
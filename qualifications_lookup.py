@@ -28,9 +28,8 @@ if __name__ == "__main__":
     cs_info = []
     for cs in call_signs:
         print(f"Processing call sign: {cs}")
-        operator = RadioOperator(cs)
-        operator.get_canadian_call_sign_info(cs)
-        qualifications = operator.get_qualifications()
+        info = RadioOperator.get_canadian_call_sign_info(cs) or {}
+        qualifications = info.get("qualifications") or ""
         cs_info.append({
             "Full Name": info.get("full_name", ""),
             "Call Sign": info.get("call_sign", ""),
@@ -0,0 +1,266 @@
+"""Durable on-disk work queue for check-ins and deferred operator lookups.
+
+Check-ins are journaled to the ``work_queue`` table before anything else
+happens, so they survive restarts and loss of connectivity. A background
+``QueueWorker`` drains the journal in batches: check-ins are always written to
+``checkins`` (bare if the lookup services cannot be reached), and the call signs
+of bare rows are queued for enrichment once upstream connectivity returns.
+"""
+
+import logging
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, Integer, String, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from dbo import Base, engine
+from operator_lookup import OperatorInfo, lookup_operator
+from radio_operator import RadioOperator, enrich_bare_checkins, insert_checkins
+
+KIND_CHECKIN = "checkin"
+KIND_ENRICH = "enrich"
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Hosts the lookups depend on; used to probe for upstream connectivity.
+LOOKUP_HOSTS = ("apc-cap.ic.gc.ca", "wireless2.fcc.gov")
+
+
+class WorkItem(Base):
+    __tablename__ = "work_queue"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    call_sign: Mapped[str] = mapped_column(String(32))
+    repeater: Mapped[Optional[str]] = mapped_column(String(32))
+    checkin_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    status: Mapped[str] = mapped_column(String(32), default=STATUS_PENDING)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[Optional[str]] = mapped_column(String)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+def is_online(hosts: tuple = LOOKUP_HOSTS, timeout: float = 3.0) -> bool:
+    """Check whether any of the lookup services can be reached."""
+    for host in hosts:
+        try:
+            with socket.create_connection((host, 443), timeout=timeout):
+                return True
+        except OSError:
+            continue
+    return False
+
+
+class WorkQueue:
+    """Journal of pending check-ins and lookups stored in the database."""
+
+    def __init__(self, max_attempts: int = 5) -> None:
+        self.logger = logging.getLogger("work_queue")
+        self.max_attempts = max_attempts
+
+    def enqueue_checkin(self, call_sign: str, repeater: str | None,
+                        retries: int = 5) -> int:
+        """Journal a check-in; it is timestamped now, not when it is processed.
+
+        Retries while the database is locked by another writer, raising
+        ``OperationalError`` only if it stays busy.
+        """
+        checkin_date = datetime.now()
+        for attempt in range(retries):
+            try:
+                with Session(engine) as session:
+                    item = WorkItem(kind=KIND_CHECKIN, call_sign=call_sign,
+                                    repeater=repeater, checkin_date=checkin_date,
+                                    status=STATUS_PENDING, attempts=0)
+                    session.add(item)
+                    session.commit()
+                    return item.id
+            except OperationalError:
+                if attempt == retries - 1:
+                    raise
+                time.sleep(0.5 * (attempt + 1))
+
+    def _queued_enrichments(self):
+        return select(WorkItem.call_sign).where(
+            WorkItem.kind == KIND_ENRICH, WorkItem.status == STATUS_PENDING
+        )
+
+    def enqueue_enrichment(self, session: Session, call_sign: str) -> None:
+        """Queue the bare ``checkins`` rows of a call sign for another lookup."""
+        if session.scalar(self._queued_enrichments().where(WorkItem.call_sign == call_sign)):
+            return
+        session.add(WorkItem(kind=KIND_ENRICH, call_sign=call_sign,
+                             status=STATUS_PENDING, attempts=0))
+
+    def enqueue_bare_checkins(self) -> int:
+        """Queue every call sign with bare ``checkins`` rows not already queued."""
+        with Session(engine) as session:
+            call_signs = session.scalars(
+                select(RadioOperator.call_sign).distinct().where(
+                    (RadioOperator.full_name.is_(None)) | (RadioOperator.full_name == ""),
+                    RadioOperator.call_sign.not_in(self._queued_enrichments()),
+                )
+            ).all()
+            for call_sign in call_signs:
+                self.enqueue_enrichment(session, call_sign)
+            session.commit()
+        self.logger.info(f"Queued {len(call_signs)} call sign(s) for enrichment")
+        return len(call_signs)
+
+    def pending(self, session: Session, kind: str, limit: int) -> list[WorkItem]:
+        """Oldest pending items of one kind, in journal order."""
+        return list(session.scalars(
+            select(WorkItem)
+            .where(WorkItem.status == STATUS_PENDING, WorkItem.kind == kind)
+            .order_by(WorkItem.id)
+            .limit(limit)
+        ))
+
+    def pending_count(self) -> int:
+        with Session(engine) as session:
+            return session.scalar(
+                select(func.count(WorkItem.id)).where(WorkItem.status == STATUS_PENDING)
+            )
+
+    def mark_done(self, item: WorkItem) -> None:
+        item.status = STATUS_DONE
+        item.updated_at = datetime.now()
+
+    def mark_retry(self, item: WorkItem, error: str) -> bool:
+        """Record a failed attempt; returns True once ``max_attempts`` is hit."""
+        item.attempts += 1
+        item.last_error = error
+        item.updated_at = datetime.now()
+        if item.attempts >= self.max_attempts:
+            item.status = STATUS_FAILED
+            return True
+        return False
+
+
+class QueueWorker(threading.Thread):
+    """Background thread that drains the work queue in batches."""
+
+    def __init__(self, queue: WorkQueue, batch_size: int = 20,
+                 poll_interval: float = 30.0) -> None:
+        super().__init__(name="QueueWorker", daemon=True)
+        self.logger = logging.getLogger("work_queue")
+        self.queue = queue
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def notify(self) -> None:
+        """Wake the worker up after new work was journaled."""
+        self._wakeup.set()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Ask the worker to finish its current item and exit."""
+        self._stopping.set()
+        self._wakeup.set()
+        self.join(timeout)
+
+    def run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                worked = self.drain_once()
+            except Exception as e:
+                self.logger.exception(f"Queue worker error: {e!s}")
+                worked = False
+            if not worked:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def drain_once(self) -> bool:
+        """Process one batch; returns whether any item was completed.
+
+        Check-ins always come first; enrichments only fill the rest of the
+        batch and give way as soon as a new check-in is journaled.
+
+        Lookups run with no transaction open, and the results are written in
+        one short transaction afterwards, so the console can keep journaling
+        check-ins while the worker waits on the network.
+        """
+        # Set again by notify() if a check-in arrives during this batch
+        self._wakeup.clear()
+        online = is_online()
+        with Session(engine) as session:
+            items = self.queue.pending(session, KIND_CHECKIN, self.batch_size)
+            if online and len(items) < self.batch_size:
+                items += self.queue.pending(session, KIND_ENRICH,
+                                            self.batch_size - len(items))
+
+        results = []
+        for item in items:
+            if self._stopping.is_set():
+                break
+            if item.kind == KIND_ENRICH and self._wakeup.is_set():
+                break
+            if item.kind == KIND_CHECKIN:
+                info, error = self._lookup(item.call_sign, online)
+                online = online and not info.lookup_failed
+            elif online:
+                info, error = self._lookup(item.call_sign, True)
+                online = not info.lookup_failed
+            else:
+                # Enrichment waits until the lookups are reachable again
+                continue
+            results.append((item.id, info, error))
+        if not results:
+            return False
+
+        completed = []
+        gave_up = []
+        with Session(engine) as session:
+            by_id = {item.id: item for item in session.scalars(
+                select(WorkItem).where(WorkItem.id.in_([r[0] for r in results]))
+            )}
+            rows = []
+            for item_id, info, error in results:
+                item = by_id[item_id]
+                if item.kind == KIND_CHECKIN:
+                    rows.append(info.checkin_row(item.repeater, item.checkin_date))
+                    if error:
+                        # Written bare now; keep the reason and try again later
+                        item.last_error = error
+                    if info.lookup_failed or error:
+                        self.queue.enqueue_enrichment(session, item.call_sign)
+                elif info.lookup_failed or error:
+                    if self.queue.mark_retry(item, error or "Lookup services unreachable"):
+                        gave_up.append((item.kind, item.call_sign, item.last_error))
+                    continue
+                elif not info.is_bare():
+                    enrich_bare_checkins(session, item.call_sign, info)
+                self.queue.mark_done(item)
+                completed.append((item.kind, info))
+            insert_checkins(session, rows)
+            session.commit()
+
+        # Log only after the commit; LogDBHandler writes to the same database.
+        for kind, info in completed:
+            if kind == KIND_CHECKIN:
+                self.logger.info(f"Logged check-in: {info}")
+        for kind, call_sign, error in gave_up:
+            self.logger.warning(f"Giving up on {kind} for {call_sign}: {error}")
+        return bool(completed)
+
+    def _lookup(self, call_sign: str, online: bool) -> tuple[OperatorInfo, str | None]:
+        """Look up a call sign, deferring the lookup if we are offline.
+
+        Returns the result and, if the page could not be parsed, the error.
+        A parse error only affects this call sign: the result is bare but not
+        ``lookup_failed``, so the worker does not treat itself as offline.
+        """
+        try:
+            return lookup_operator(call_sign, lookup=online), None
+        except Exception as e:
+            self.logger.exception(f"Lookup failed for {call_sign}: {e!s}")
+            return OperatorInfo(call_sign), str(e)